@@ -16,32 +16,267 @@ The Agent Framework is the latest Microsoft SDK for building AI agents with:
 - Multiple providers (Azure AI, OpenAI, GitHub Models)
 """
 
+import argparse
 import asyncio
+import functools
+import hashlib
+import json
 import os
+import pathlib
+import re
+import sys
+import textwrap
+import types
 
-from dotenv import load_dotenv
-from agent_framework import MCPStreamableHTTPTool
-from agent_framework.azure import AzureAIAgentsProvider
-from azure.identity.aio import AzureCliCredential
-
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env, unless the environment (e.g. a container)
+# already exports every setting .env could supply. Each setting may be given under
+# any of its accepted names; the MCP settings must be exported too (their built-in
+# defaults do not count), otherwise a .env override of them would be ignored.
+_ENV_SETTINGS = (
+    ("PROJECT_ENDPOINT", "AZURE_AI_PROJECT_ENDPOINT"),
+    ("MODEL_DEPLOYMENT_NAME", "AZURE_AI_MODEL_DEPLOYMENT_NAME"),
+    ("MCP_SERVER_URL",),
+    ("MCP_SERVER_NAME",),
+)
+if not all(any(os.environ.get(name) for name in names) for names in _ENV_SETTINGS):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Azure AI Foundry Configuration
 PROJECT_ENDPOINT = os.environ.get("PROJECT_ENDPOINT") or os.environ.get("AZURE_AI_PROJECT_ENDPOINT", "")
 MODEL_DEPLOYMENT = os.environ.get("MODEL_DEPLOYMENT_NAME") or os.environ.get("AZURE_AI_MODEL_DEPLOYMENT_NAME", "gpt-4o-mini")
 
+# Expected shape of a Foundry project endpoint; checked before any network call
+_ENDPOINT_RE = re.compile(r"https://[^/?#\s]+\.services\.ai\.azure\.com/api/projects/[^/?#\s]+/?")
+
 # MCP Server Configuration
 MCP_SERVER_URL = os.environ.get("MCP_SERVER_URL", "https://learn.microsoft.com/api/mcp")
 MCP_SERVER_NAME = os.environ.get("MCP_SERVER_NAME", "Microsoft Learn MCP")
 
+# Upper bound on agent runs in flight at once
+MAX_CONCURRENT_QUERIES = 8
+
+# Name of the docs agent on the service
+DOCS_AGENT_NAME = "docs-assistant"
+
+# Agent instructions, dedented once at import so no indentation is sent to the service
+DOCS_AGENT_INSTRUCTIONS = textwrap.dedent("""
+    You are a helpful documentation assistant that specializes in
+    Microsoft Azure and .NET documentation. You have access to the Microsoft Learn
+    documentation through MCP tools.
+
+    IMPORTANT: Always use the MCP tools to search Microsoft Learn documentation before
+    answering questions. Do not rely solely on your training data - use the tools to
+    get the latest, accurate information from official Microsoft documentation.
+
+    When users ask questions:
+    1. Use the MCP tools to search for relevant documentation
+    2. Provide clear, helpful summaries based on what you find
+    3. Always cite the source URLs
+""").strip()
+
+SIMPLE_AGENT_INSTRUCTIONS = (
+    "You are a helpful documentation assistant. Use MCP tools to search Microsoft Learn."
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _lazy_imports():
+    """
+    Import the Agent Framework and Azure SDK on first use.
+
+    These imports dominate start-up time, so they are deferred until the
+    configuration has been validated and run only once per process.
+    """
+    from agent_framework import MCPStreamableHTTPTool
+    from agent_framework.azure import AzureAIAgentsProvider
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.identity.aio import AzureCliCredential
+
+    return types.SimpleNamespace(
+        MCPStreamableHTTPTool=MCPStreamableHTTPTool,
+        AzureAIAgentsProvider=AzureAIAgentsProvider,
+        ResourceNotFoundError=ResourceNotFoundError,
+        AzureCliCredential=AzureCliCredential,
+    )
+
+
+# Shared Azure CLI credential and agents provider, created on first use and
+# bound to the event loop that created them
+_CREDENTIAL = None
+_PROVIDER = None
+_SHARED_LOOP = None
+
+
+def _bind_shared_clients():
+    """
+    Drop shared clients left over from a previous event loop.
+
+    Their aiohttp transports belong to a loop that has since been closed (e.g. a
+    second asyncio.run()), so fresh ones are created for the running loop instead.
+    """
+    global _CREDENTIAL, _PROVIDER, _SHARED_LOOP
+    loop = asyncio.get_running_loop()
+    if _SHARED_LOOP is not loop:
+        _CREDENTIAL = None
+        _PROVIDER = None
+        _SHARED_LOOP = loop
+
+
+def get_credential():
+    """
+    Return the Azure CLI credential shared by the running event loop.
+
+    Reusing one credential avoids building a new one (and re-running `az`)
+    for every query; release it with close_shared_clients().
+    """
+    global _CREDENTIAL
+    _bind_shared_clients()
+    if _CREDENTIAL is None:
+        _CREDENTIAL = _lazy_imports().AzureCliCredential()
+    return _CREDENTIAL
+
+
+def get_provider():
+    """
+    Return the AzureAIAgentsProvider shared by the running event loop.
+
+    The provider owns the AgentsClient and its HTTP connection pool, so sharing it
+    lets repeated queries reuse keep-alive connections to the Foundry endpoint.
+    Release it with close_shared_clients().
+    """
+    global _PROVIDER
+    _bind_shared_clients()
+    if _PROVIDER is None:
+        _PROVIDER = _lazy_imports().AzureAIAgentsProvider(
+            credential=get_credential(),
+            project_endpoint=PROJECT_ENDPOINT,
+        )
+    return _PROVIDER
+
+
+async def close_shared_clients():
+    """
+    Close the shared provider and credential.
+
+    Call this once you are done with run_with_mcp_tools()/run_simple_query() in
+    the current event loop; main() does so automatically. Later calls create new
+    clients as needed.
+    """
+    global _CREDENTIAL, _PROVIDER, _SHARED_LOOP
+    provider, credential = _PROVIDER, _CREDENTIAL
+    _PROVIDER = _CREDENTIAL = _SHARED_LOOP = None
+    try:
+        if provider is not None:
+            await provider.close()
+    finally:
+        if credential is not None:
+            await credential.close()
+
+
+def create_mcp_tool():
+    """Build the Microsoft Learn MCP tool from the configured server settings."""
+    return _lazy_imports().MCPStreamableHTTPTool(
+        name=MCP_SERVER_NAME,
+        url=MCP_SERVER_URL,
+    )
+
+
+# On-disk memo of agents already created on the service (and the last thread used)
+_AGENT_CACHE = pathlib.Path("~/.cache/mcp_sample/agent.json").expanduser()
+
+
+def _load_cache():
+    """Read the agent cache, treating a missing or corrupt file as empty."""
+    try:
+        cache = json.loads(_AGENT_CACHE.read_text())
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _cached_threads(cache):
+    """Return the cache's thread map, resetting it if it is not a JSON object."""
+    threads = cache.get("threads")
+    if not isinstance(threads, dict):
+        threads = cache["threads"] = {}
+    return threads
+
+
+def _save_cache(cache):
+    """Write the agent cache; failing to persist it is not fatal."""
+    try:
+        _AGENT_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        _AGENT_CACHE.write_text(json.dumps(cache, indent=2))
+    except OSError:
+        pass
+
+
+def agent_cache_key(name: str, instructions: str):
+    """
+    Return the cache key for an agent configuration.
+
+    The key covers project, name, model, instructions and MCP server, so any
+    change to the configuration maps to a different agent (and thread).
+    """
+    return hashlib.blake2b(
+        "\0".join([PROJECT_ENDPOINT, name, MODEL_DEPLOYMENT, instructions, MCP_SERVER_URL]).encode(),
+        digest_size=16,
+    ).hexdigest()
+
+
+def load_thread_id(key: str):
+    """Return the conversation thread persisted for an agent key, if any."""
+    return _cached_threads(_load_cache()).get(key)
+
+
+def save_thread_id(key: str, thread_id: str | None):
+    """Persist the conversation thread for an agent key; None forgets it."""
+    cache = _load_cache()
+    cache.pop("thread_id", None)  # unkeyed entry written by earlier versions
+    threads = _cached_threads(cache)
+    if thread_id:
+        threads[key] = thread_id
+    else:
+        threads.pop(key, None)
+    _save_cache(cache)
+
+
+async def get_or_create_agent(provider, name: str, instructions: str, tool):
+    """
+    Return a ChatAgent for the docs assistant, reusing a previously created agent.
+
+    Agents are keyed by agent_cache_key(), so any change to the configuration
+    provisions a fresh agent. A cache hit costs a single get_agent call; a stale
+    entry (agent deleted on the service) falls back to create_agent.
+    """
+    key = agent_cache_key(name, instructions)
+    cache = _load_cache()
+
+    agent_id = cache.get(key)
+    if agent_id:
+        try:
+            return await provider.get_agent(agent_id, tools=tool)
+        except _lazy_imports().ResourceNotFoundError:
+            pass
+
+    agent = await provider.create_agent(
+        name=name,
+        model=MODEL_DEPLOYMENT,
+        instructions=instructions,
+        tools=tool,
+    )
+    cache[key] = agent.id
+    _save_cache(cache)
+    return agent
+
 
 async def run_with_mcp_tools():
     """
     Create an Azure AI Agent with Microsoft Learn MCP tools.
     
-    The agent uses the AzureAIAgentsProvider which automatically connects to your
-    Azure AI Foundry project using Azure CLI credentials.
+    The agent uses the shared AzureAIAgentsProvider which connects to your
+    Azure AI Foundry project using the shared Azure CLI credential.
     """
     print("\n🚀 Microsoft Agent Framework - MCP Tools Demo")
     print("=" * 60)
@@ -50,89 +285,157 @@ async def run_with_mcp_tools():
     print(f"   Project: {PROJECT_ENDPOINT}")
     print("=" * 60)
     
-    async with (
-        AzureCliCredential() as credential,
-        AzureAIAgentsProvider(
-            credential=credential,
-            project_endpoint=PROJECT_ENDPOINT,
-        ) as provider,
-    ):
-        # Create agent with MCP tool attached at agent level
-        agent = await provider.create_agent(
-            name="docs-assistant",
-            model=MODEL_DEPLOYMENT,
-            instructions="""You are a helpful documentation assistant that specializes in 
-Microsoft Azure and .NET documentation. You have access to the Microsoft Learn 
-documentation through MCP tools.
-
-IMPORTANT: Always use the MCP tools to search Microsoft Learn documentation before 
-answering questions. Do not rely solely on your training data - use the tools to 
-get the latest, accurate information from official Microsoft documentation.
-
-When users ask questions:
-1. Use the MCP tools to search for relevant documentation
-2. Provide clear, helpful summaries based on what you find
-3. Always cite the source URLs""",
-            tools=MCPStreamableHTTPTool(
-                name=MCP_SERVER_NAME,
-                url=MCP_SERVER_URL,
-            ),
-        )
+    provider = get_provider()
+    # Reuse (or create) the agent with MCP tool attached at agent level
+    agent = await get_or_create_agent(
+        provider,
+        name=DOCS_AGENT_NAME,
+        instructions=DOCS_AGENT_INSTRUCTIONS,
+        tool=create_mcp_tool(),
+    )
+    
+    print(f"\n✅ Agent ready: {agent.name} ({agent.id})")
+    
+    # Use agent context manager to connect MCP tools
+    async with agent:
+        # Example queries
+        queries = [
+            "Search Microsoft Learn for 'Azure Functions Python quickstart' and summarize the key steps.",
+            "What is Microsoft Agent Framework? Search the docs.",
+        ]
+        
+        # The queries are independent, so run them concurrently on the shared
+        # agent (and its MCP session), bounded to avoid flooding the service.
+        # Each run streams its text into its own queue; queues are drained in
+        # order, so the current query prints live while later ones buffer.
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
         
-        print(f"\n✅ Created agent: {agent.name}")
+        async def stream_query(query, chunks):
+            try:
+                async with semaphore:
+                    async for update in agent.run_stream(query):
+                        if update.text:
+                            chunks.put_nowait(update.text)
+            finally:
+                chunks.put_nowait(None)
         
-        # Use agent context manager to connect MCP tools
-        async with agent:
-            # Example queries
-            queries = [
-                "Search Microsoft Learn for 'Azure Functions Python quickstart' and summarize the key steps.",
-                "What is Microsoft Agent Framework? Search the docs.",
-            ]
-            
-            for query in queries:
-                print(f"\n{'='*60}")
-                print(f"💬 User: {query}")
-                print("-" * 60)
-                
-                result = await agent.run(query)
-                
-                print(f"\n📨 {agent.name}:")
-                print(result)
-                print("=" * 60)
+        outputs = [asyncio.Queue() for _ in queries]
+        tasks = [
+            asyncio.create_task(stream_query(query, chunks))
+            for query, chunks in zip(queries, outputs)
+        ]
+        
+        for query, chunks in zip(queries, outputs):
+            print(f"\n{'='*60}")
+            print(f"💬 User: {query}")
+            print("-" * 60)
+            print(f"\n📨 {agent.name}:")
+            while (text := await chunks.get()) is not None:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            print()
+            print("=" * 60)
+        
+        # Surface any run failure once all output has been printed
+        await asyncio.gather(*tasks)
     
     print("\n✅ Demo completed!")
 
 
-async def run_simple_query(query: str):
+async def run_simple_query(query: str, thread_id: str | None = None, *, remember_thread: bool = False):
     """
     Simple function to run a single query against the docs agent.
+    
+    Pass the thread_id returned by a previous call to continue that conversation
+    on the same service-side thread instead of starting a new one. If that thread
+    no longer exists, a notice is printed and the query runs on a fresh thread,
+    whose id is returned.
+    
+    With remember_thread=True, the thread is loaded from (when thread_id is not
+    given) and saved back to the on-disk cache, keyed by this agent's configuration.
+    
+    Uses the shared provider; await close_shared_clients() when done.
+    
+    Returns:
+        A (result, thread_id) tuple.
     """
-    async with (
-        AzureCliCredential() as credential,
-        AzureAIAgentsProvider(
-            credential=credential,
-            project_endpoint=PROJECT_ENDPOINT,
-        ) as provider,
-    ):
-        agent = await provider.create_agent(
-            name="docs-assistant",
-            model=MODEL_DEPLOYMENT,
-            instructions="You are a helpful documentation assistant. Use MCP tools to search Microsoft Learn.",
-            tools=MCPStreamableHTTPTool(
-                name=MCP_SERVER_NAME,
-                url=MCP_SERVER_URL,
-            ),
-        )
+    name, instructions = DOCS_AGENT_NAME, SIMPLE_AGENT_INSTRUCTIONS
+    provider = get_provider()
+    agent = await get_or_create_agent(
+        provider,
+        name=name,
+        instructions=instructions,
+        tool=create_mcp_tool(),
+    )
+    
+    if remember_thread:
+        key = agent_cache_key(name, instructions)
+        if thread_id is None:
+            thread_id = load_thread_id(key)
+    
+    result, thread_id = await _run_on_thread(agent, query, thread_id)
+    
+    if remember_thread:
+        save_thread_id(key, thread_id)
+    return result, thread_id
+
+
+async def _run_on_thread(agent, query, thread_id):
+    """
+    Run query on the given service thread, or on a fresh one if none is given.
+    
+    The thread is looked up before the run, so only a thread that is confirmed
+    missing on the service starts a new conversation; errors from the run itself
+    (e.g. a deleted model deployment) propagate unchanged.
+    """
+    async with agent:
+        if thread_id:
+            try:
+                await agent.chat_client.agents_client.threads.get(thread_id)
+            except _lazy_imports().ResourceNotFoundError:
+                print(f"⚠️  Conversation thread {thread_id} no longer exists; starting a new conversation.")
+                thread_id = None
         
-        async with agent:
-            result = await agent.run(query)
-            return result
+        thread = agent.get_new_thread(service_thread_id=thread_id)
+        result = await agent.run(query, thread=thread)
+        return result, thread.service_thread_id
+
+
+def parse_args(argv=None):
+    """Parse the command line; runs before any SDK import so --help stays fast."""
+    parser = argparse.ArgumentParser(
+        description="Microsoft Learn docs agent on Azure AI Foundry with MCP tools.",
+    )
+    parser.add_argument(
+        "question",
+        nargs="?",
+        help="ask a single question, continuing the conversation from the previous run "
+        "(omit to run the demo queries)",
+    )
+    return parser.parse_args(argv)
 
 
-async def main():
-    """Main entry point."""
+async def main(argv=None):
+    """
+    Main entry point.
+    
+    With no arguments, runs the demo. `python main.py "<question>"` asks a single
+    question instead, continuing the conversation thread from the previous run.
+    """
+    args = parse_args(argv)
+    
+    if not _ENDPOINT_RE.fullmatch(PROJECT_ENDPOINT):
+        print("❌ PROJECT_ENDPOINT is not set to an Azure AI Foundry project endpoint.")
+        print("\n💡 Tip: Copy .env.example to .env and set PROJECT_ENDPOINT, e.g.")
+        print("   https://<your-resource>.services.ai.azure.com/api/projects/<your-project>")
+        return
+    
     try:
-        await run_with_mcp_tools()
+        if args.question:
+            result, _ = await run_simple_query(args.question, remember_thread=True)
+            print(result)
+        else:
+            await run_with_mcp_tools()
     except Exception as e:
         print(f"\n❌ Error: {e}")
         import traceback
@@ -142,6 +445,8 @@ async def main():
             print("\n💡 Tip: You need 'Azure AI User' role on the AI Foundry resource.")
         elif "az login" in str(e).lower() or "credential" in str(e).lower():
             print("\n💡 Tip: Run 'az login' first to authenticate with Azure.")
+    finally:
+        await close_shared_clients()
 
 
 if __name__ == "__main__":